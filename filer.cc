@@ -2,7 +2,10 @@
 --------   
 WARNING: IN ORDER TO COMPILE THIS ON LINUX, USE:
 
-   c++ filer.cc -o filer
+   c++ -O2 filer.cc -o filer
+
+(-O2 isn't required, but the matcher is where all the time goes, and
+it's a lot quicker optimized.)
 
 There are weird incompatibilites between Unix and Linux
 regarding getop (which is in unistd.h in Linux), and 
@@ -51,16 +54,15 @@ made by the program!  (See disclaimer, above)
 #include <stdlib.h>
 #include <stdio.h>
 #include <iostream>
+#include <string>
 #include <string.h>
 #include <dirent.h>
 #include <time.h>
 
-#define FNLEN 300 // max lenth of a filename or rebuilt name
-
 using namespace std;
 
-void clrtbln(char table[FNLEN]);
-int match(char fn[], char p[], int fp, int pp, int tp);
+void compilematch();
+void compilerebuild();
 void rebuild();
 void rbquote(int &l);
 void rbdate(int &l);
@@ -73,31 +75,72 @@ int include_dots = 0;
 
 int quotenames = 0;
 
-// The table holds the match results.  Each entry begins with a type
-// char (either * or ?, or zero for empty), and then up to fifty chars
-// of content which go with that item.
+// The table holds the match results.  Each entry has a type char
+// (either * or ?, or zero for empty), and then where in the filename
+// the text that goes with that item starts, and how long it is.  The
+// text itself isn't copied; it stays in the filename (mfn) until
+// rebuilding needs it.  The types only depend on the match pattern,
+// so compilematch fills them in once and the matcher just sets the
+// spans.
+
+struct tabent
+{
+  char type;
+  int start;
+  int len;
+};
 
-char table[10][FNLEN];
+tabent table[10];
+char *mfn; // the filename that the table entries point into
 
-char nn[FNLEN]; // holds the resulting name from rebuilding
-int nnp; // where in the new name are we?
-char r[FNLEN]; // the rebuilding pattern (ought to be more localized)
-char p[FNLEN]; // the match pattern
+// There are no fixed limits on name or pattern lengths: the patterns
+// are used straight from argv, the compiled forms are sized to fit
+// them, and nn grows as needed (keeping its space from file to file).
+
+string nn; // holds the resulting name from rebuilding
+char *r = ""; // the rebuilding pattern (ought to be more localized)
+char *p = ""; // the match pattern
 char *cmd = ""; // the command, if any.
+int plit; // match pattern has no wild cards (set by compilematch)
+int rlit; // rebuilt name is the same for every file (set by compilerebuild)
+
+// The match pattern is compiled once, before the directory is read,
+// into a list of tokens.  A token is a * or a ? (with the table entry
+// that it fills), or a run of literal chars (type zero) that gets
+// compared all at once.  minrest is the fewest chars that this token
+// and everything after it can possibly match, which lets the matcher
+// give up on a * as soon as there isn't room left for the rest.
 
-// time structs
+struct ptoken
+{
+  char type;
+  int slot;
+  char *lit;
+  int len;
+  int minrest;
+};
 
-time_t* tp;
-tm* tn;
+ptoken *ptok;
+int nptok;
+
+int match(const char *fn, const ptoken *tok, int ntok, tabent *tab);
+
+// The one timestamp used for every 'd spec in this run.
+
+tm tn;
 
 int main (int argc, char *argv[])
 {
+  // Everything goes out through cout, so there's no need to keep it
+  // in step with stdio, and leaving it unsynced lets cout buffer the
+  // commands in big blocks instead of handing each piece to stdio.
+
+  ios::sync_with_stdio(false);
+
   // Time only needs to be computed once.
 
-  tp = (time_t *) malloc(sizeof(time_t));
-  tn = (tm *) malloc(sizeof(tm));
-  time(tp);
-  tn = localtime(tp);
+  time_t now = time(NULL);
+  tn = *localtime(&now);
 
   // option processing
 
@@ -185,16 +228,31 @@ int main (int argc, char *argv[])
       {dirspec = optarg;
 	break;}
     case 'm':
-      {strcpy(&p[0], optarg);
+      {p = optarg;
       break;}
     case 'r':
-      {strcpy(&r[0], optarg);
+      {r = optarg;
       break;}
     case ':':	    // missing arg.
       {cout << "Filer: Option -" << optopt << " requires an argument\n";
 	exit(2);}
     }
   
+  compilematch();
+  compilerebuild();
+
+  // Quoting doesn't change from file to file, so pick the quote once.
+
+  const char *q = quotenames ? "\"" : "";
+
+  // Two easy special cases.  With no wild cards in the match pattern,
+  // it's just the one file of that name (if it's there at all), so a
+  // strcmp will do, and we can stop as soon as we've seen it.  With no
+  // * or ? in the rebuilding pattern, every file gets the same new
+  // name, so it only needs to be built once.
+
+  if (rlit) rebuild();
+
   // Okay, here's the good work.
 
   DIR *dirp;
@@ -204,113 +262,155 @@ int main (int argc, char *argv[])
 
   dirp = opendir(dirspec);
   
-  // Match for each file in the master list.  The matcher will put a \0 in
-  // the first char of each file that fails to match.
+  // Match for each file in the master list.  Dot files are dropped
+  // right here (unless -a), so the matcher never sees them.
 
   while ((dp = readdir(dirp)) != NULL) 
     {
-      // Clear out the table.
-      
-      for (int k=0;k<10;k++)
-	for (int l=0;l<FNLEN;l++)
-	  table[k][l]=0;
+      if (dp->d_name[0] == '.' && include_dots == 0) continue;
+
+      mfn = dp->d_name;
 
-      if(match(dp->d_name, p, 0, 0, 0))
+      if(plit ? strcmp(dp->d_name, p) == 0 : match(dp->d_name, ptok, nptok, table))
 	{
-	 rebuild();
-         if (quotenames){
-	 cout << cmd << " \"" << dirspec << "/" << dp->d_name << "\" \"" << nn << "\"" << '\n';}
-         else {
-	 cout << cmd << " " << dirspec << "/" << dp->d_name << " " << nn << '\n';}
+	 if (!rlit) rebuild();
+	 cout << cmd << ' ' << q << dirspec << '/' << dp->d_name << q << ' ' << q << nn << q << '\n';
+	 if (plit) break; // names in a directory are unique
        }
     }
 
   (void) closedir(dirp);
 }
 
-// The smart matcher uses * (any chars) and ? (any one char).
-// Returns 1 for a good match, 0 for a bad one.  If the match is
-// bad, the table is invalid.
+// Compile the match pattern into ptok, and set up the table types.
 
-int match(char fn[], char p[], int fp, int pp, int tp)
+void compilematch()
 {
-  if (fn[0] == '.' && include_dots == 0) return (0);
-  while(1)
-    {
-
-      // If we're at the end of the filename, and at the end of the
-      // pattern simulataneously, then we win!
+  int slot = 0;
 
-      if (fn[fp] == 0 && fn[fp] == p[pp]) 
-	return 1;
+  ptok = new ptoken[strlen(p) + 1];
+  nptok = 0;
+  for (int pp = 0; p[pp] != 0;)
+    {
+      ptoken &t = ptok[nptok++];
+      if (p[pp] == '*' || p[pp] == '?')
+	{
+	  if (slot > 9)
+	    {
+	      cout << "Filer: Too many wild cards in match pattern (max 10)!\n";
+	      exit(2);
+	    }
+	  t.type = p[pp++];
+	  t.slot = slot;
+	  table[slot++].type = t.type;
+	}
       else
+	{
+	  t.type = 0;
+	  t.lit = &p[pp];
+	  t.len = strcspn(&p[pp], "*?");
+	  pp += t.len;
+	}
+    }
 
-	// If we're out of one or the other, fail!
+  plit = (slot == 0);
 
-	if (fn[fp] == 0 || p[pp] == 0)
-	  return 0;
-	else
+  // Wild cards take at least one char, literal runs take exactly
+  // their own length.
 
-	  // if they're the same letter, still okay, move on thru recursion.
+  for (int tk = nptok - 1, rest = 0; tk >= 0; tk--)
+    {
+      rest += (ptok[tk].type == 0) ? ptok[tk].len : 1;
+      ptok[tk].minrest = rest;
+    }
+}
 
-	  if (fn[fp] == p[pp])
-	    return match(fn, p, fp + 1, pp + 1, tp);
-	  else
+// The smart matcher uses * (any chars) and ? (any one char).
+// Returns 1 for a good match, 0 for a bad one.  If the match is
+// bad, the table is invalid.
+//
+// It doesn't recurse.  Each * first takes just one char; when
+// something after it fails, the most recent * takes one more char and
+// we carry on from just past it.  Earlier *s never need to be
+// revisited, because the later * can always soak up the difference.
+// That also leaves each * with the shortest run that works, same as
+// trying them one at a time would.
+//
+// Everything the matcher needs comes in as arguments (the compiled
+// tokens, and the table to fill), and it doesn't touch any globals,
+// so the compiler is free to keep it all in registers.
+
+int match(const char *fn, const ptoken *tok, int ntok, tabent *tab)
+{
+  int fp = 0; // where we are in the filename
+  int tk = 0; // which pattern token we're up to
+  int startk = -1; // the last * token we went past (-1 if none yet)
+  int fnlen = strlen(fn);
 
-	    // See if the one is a ? -- still okay, but save it!
+  // Too short for the pattern?  Then there's no point trying.
 
-	    if(p[pp] == '?')
-	      {
-		clrtbln(table[tp]); // Clear the line of the table
-		table[tp][0] = '?';
-		table[tp][1] = fn[fp];
-		return match(fn, p, fp + 1, pp + 1, tp + 1);
-	      }
+  if (ntok > 0 && fnlen < tok[0].minrest)
+    return 0;
+
+  while(1)
+    {
+      if (tk == ntok)
+	{
+	  // If we're at the end of the filename, and at the end of the
+	  // pattern simulataneously, then we win!
 
-	    else
+	  if (fn[fp] == 0)
+	    return 1;
+	}
+      else
+	{
+	  const ptoken &t = tok[tk];
 
-	      // See if the one is a * -- still okay, also save it and recurse
-	      // The way that this is written, * must match at least
-	      // one char.  I'm not sure that I like it that way.
+	  // A literal run has to be there in full.  (strncmp stops at
+	  // the end of the filename, so running out is just a mismatch.)
 
-	      if(p[pp] == '*')
+	  if (t.type == 0)
+	    {
+	      if (strncmp(fn + fp, t.lit, t.len) == 0)
 		{
-		  int sp = 1; // set up a local star pointer
-
-		  clrtbln(table[tp]); // Clear the line of the table
-		  table[tp][0] = '*'; // Insert marker for *
-
-		  table[tp][sp] = fn[fp];
-		  if (match(fn, p, fp + 1, pp + 1, tp + 1))
-		    return 1;
-		  else
-
-		    // If we got here then we want to expand the * entry by
-		    // one, and if we hit the end, then fail this *.
-
-		    while(1)
-		      {
-			table[tp][++sp] = fn[++fp];
-			if (fn[fp] == 0)
-			  {
-			    if (p[pp + 1] == 0)
-			      return 1;
-			    else
-			      return 0;
-			  }
-			else
-			  if (match(fn, p, fp + 1, pp + 1, tp + 1))
-			    return 1;
-		      }
+		  fp += t.len;
+		  tk++;
+		  continue;
 		}
-	      else
-		return 0;
-    }
-}
+	    }
+	  else
 
-void clrtbln(char table[FNLEN])
-{
-  for (int k = 0; k < FNLEN; k++) table[k] = 0;
+	    // A ? or a * both need at least one char -- save it!  The
+	    // way that this is written, * must match at least one char.
+	    // I'm not sure that I like it that way.
+
+	    if (fn[fp] != 0)
+	      {
+		if (t.type == '*') startk = tk;
+		tab[t.slot].start = fp++;
+		tab[t.slot].len = 1;
+		tk++;
+		continue;
+	      }
+	}
+
+      // Something didn't fit, so stretch the last * by one char and
+      // try again from there.  If there's no * to stretch, or
+      // stretching it wouldn't leave enough of the filename for the
+      // rest of the pattern, fail!  (Stretching only ever leaves less
+      // room, so there's no use going on past that point.)
+
+      if (startk < 0)
+	return 0;
+
+      tabent &st = tab[tok[startk].slot];
+      int rest = (startk + 1 < ntok) ? tok[startk + 1].minrest : 0;
+      if (st.start + st.len + 1 + rest > fnlen)
+	return 0;
+      st.len++;
+      fp = st.start + st.len;
+      tk = startk + 1;
+    }
 }
 
 // Here's the rebuilding code.  Uses the table as a global.  The spec
@@ -319,20 +419,46 @@ void clrtbln(char table[FNLEN])
 // a single digit, indicating the nth * ot ? should be used.  If no
 // 'n is indicated, the NEXT *? is used (from 0 or the last 'n).
 
+// None of that depends on the filename, so the rebuilding pattern is
+// compiled once, up front, into a little program of ops, and then
+// rebuild just runs through the ops for each file.  An op is either a
+// run of literal chars (type zero) or a copy of a table entry ('c').
+// Dates come out the same for every file (there's just the one
+// timestamp per run), so they're formatted at compile time, into
+// datetext, and become literal runs like any other.
+
+struct rbop
+{
+  char type;
+  int slot;
+  const char *lit;
+  int len;
+};
+
+rbop *rbprog;
+int nrbops;
+
+char *datetext; // every 'd spec is 3 chars, and makes at most 8
+int datesize;
+int datep;
+
 void rbstar(int &l);
 void rbqmark(int &l);
 
 int stk = 0; // last *
 int qmk = 0; // last ?
 
-void rebuild()
+void compilerebuild()
 {
   stk = 0;
   qmk = 0;
-
-  nnp=0; // this ought to be local, and global only to our fns.  Next lifetime.
-
-  for (int k = 0; k < FNLEN; k++) nn[k]=0;
+  int rlen = strlen(r);
+  rbprog = new rbop[rlen + 1];
+  nrbops = 0;
+  datesize = 3 * rlen + 1;
+  datetext = new char[datesize];
+  datep = 0;
+  rlit = 1;
 
   for (int l = 0; r[l] != 0;)
     {
@@ -345,11 +471,39 @@ void rebuild()
 	  if (r[l] == '\'')
 	    rbquote(l);
 	  else
-	    nn[nnp++] = r[l++];
+	    {
+	      rbop &o = rbprog[nrbops++];
+	      o.type = 0;
+	      o.lit = &r[l];
+	      o.len = strcspn(&r[l], "*?'");
+	      l += o.len;
+	    }
+    }
+}
+
+void rebuild()
+{
+  const char *fn = mfn;
+
+  // Literal runs come from the pattern, table entries from the
+  // filename.  Everything gets appended as whole runs, and clear()
+  // keeps nn's space, so after the first few files this never has to
+  // allocate.
+
+  nn.clear();
+  for (int op = 0; op < nrbops; op++)
+    {
+      const rbop &o = rbprog[op];
+      if (o.type == 0)
+	nn.append(o.lit, o.len);
+      else
+	{
+	  const tabent &e = table[o.slot];
+	  nn.append(fn + e.start, e.len);
+	}
     }
 }
 
-void rbcpy(int where);
 int getdigit(int &l);
 
 void rbstar(int &l)
@@ -369,16 +523,23 @@ void rbstar(int &l)
 
   for (where = 0; dg != 0; where++)
     {
-      if (table[where][0] == '*')
+      if (where > 9) break;
+      if (table[where].type == '*')
 	dg--;
-      if (where > 9) dg = 0;
     }
 
-  if (table[where - 1][0] == 0) cout << "Can't find indexed pattern item.\n";
+  if (dg != 0)
+    {
+      cout << "Can't find indexed pattern item.\n";
+      return;
+    }
 
   // pipe it into the output
   
-  rbcpy(where - 1);
+  rbop &o = rbprog[nrbops++];
+  o.type = 'c';
+  o.slot = where - 1;
+  rlit = 0;
 }
 
 void rbquote(int &l)
@@ -396,44 +557,29 @@ void rbquote(int &l)
 
 void rbdate(int &l)
 {
+  const char *fmt;
+
   switch(r[++l])
     {
-    case 'y':
-      strftime(nn+nnp, 3, "%y", tn);
-      nnp = nnp+2; l++;
-      break;
-    case 'Y': 
-      strftime(nn+nnp, 5, "%Y", tn);
-      nnp = nnp+4; l++;
-      break;
-    case 'm': 
-      strftime(nn+nnp, 3, "%m", tn);
-      nnp = nnp+2; l++;
-      break;
-    case 'd': 
-      strftime(nn+nnp, 3, "%d", tn);
-      nnp = nnp+2; l++;
-      break;
-    case 'M': 
-      strftime(nn+nnp, 3, "%M", tn);
-      nnp = nnp+2; l++;
-      break;
-    case 'H': 
-      strftime(nn+nnp, 3, "%H", tn);
-      nnp = nnp+2; l++;
-      break;
-    case 's': 
-      strftime(nn+nnp, 9, "%Y%m%d", tn);
-      nnp = nnp+8; l++;
-      break;
-    case 't': 
-      strftime(nn+nnp, 5, "%H%M", tn);
-      nnp = nnp+4; l++;
-      break;
+    case 'y': fmt = "%y"; break;
+    case 'Y': fmt = "%Y"; break;
+    case 'm': fmt = "%m"; break;
+    case 'd': fmt = "%d"; break;
+    case 'M': fmt = "%M"; break;
+    case 'H': fmt = "%H"; break;
+    case 's': fmt = "%Y%m%d"; break;
+    case 't': fmt = "%H%M"; break;
     default:
       cout << "Filer: Invalid 'd_ date spec!\n";
       exit(2);
     }
+  l++;
+
+  rbop &o = rbprog[nrbops++];
+  o.type = 0;
+  o.lit = &datetext[datep];
+  o.len = strftime(&datetext[datep], datesize - datep, fmt, &tn);
+  datep += o.len;
 }
   
 
@@ -454,48 +600,42 @@ void rbqmark(int &l)
 
   for (where = 0; dg != 0; where++)
     {
-      if (table[where][0] == '?')
+      if (where > 9) break;
+      if (table[where].type == '?')
 	dg--;
-      if (where > 9) dg = 0;
     }
 
-  if (table[where - 1][0] == 0) cout << "Can't find indexed pattern item.\n";
+  if (dg != 0)
+    {
+      cout << "Can't find indexed pattern item.\n";
+      return;
+    }
 
   // pipe it into the output
   
-  rbcpy(where - 1);
-}
-
-// Copy the table entry into the end of the rebuilt name.
-
-void rbcpy(int where)
-{
-  int tk = 1; // where in the table entry we are
-  while (table[where][tk] != 0)
-    {
-      nn[nnp++] = table[where][tk++];
-    }
+  rbop &o = rbprog[nrbops++];
+  o.type = 'c';
+  o.slot = where - 1;
+  rlit = 0;
 }
 
 // Getdigit sees if there's an 'n after a special mark.  If not, it
 // returns 0, else it returns the digit and updates the incoming
-// rbpat place pointed two ahead.
+// rbpat place pointed two ahead.  A bad digit returns 99; if the
+// pattern just ends after the ', l is left on the end, not past it.
 
 int getdigit(int &l)
 {
-  int d;
-
   if (r[l] != '\'')
     return 0;
-  else
-    {
-      l++;
-      d = r[l++] - 48; // get a digit from its char rep, I think....??
-      if (d >= 1 && d <= 10)
-	return d;
-      else
-	return 99;
-    }
+  l++;
+  char c = r[l];
+  if (c == 0)
+    return 99;
+  l++;
+  if (c >= '1' && c <= '9')
+    return c - '0';
+  return 99;
 }
 
 